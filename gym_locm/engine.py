@@ -318,6 +318,7 @@ class State:
         self.phase = Phase.DRAFT
         self.turn = 1
         self.was_last_action_invalid = False
+        self.version = 0
         self.players = (Player(PlayerOrder.FIRST), Player(PlayerOrder.SECOND))
         self._current_player = PlayerOrder.FIRST
         self.__available_actions = None
@@ -534,6 +535,9 @@ class State:
         self.__available_actions = None
         self.__action_mask = None
 
+        # lets observers know the state has changed
+        self.version += 1
+
     def _next_instance_id(self):
         self.instance_counter += 1
 
@@ -936,7 +940,10 @@ class State:
         cloned_state.k = self.k
         cloned_state.n = self.n
         cloned_state._current_player = self._current_player
+        cloned_state.was_last_action_invalid = self.was_last_action_invalid
+        cloned_state.version = self.version
         cloned_state.__available_actions = self.__available_actions
+        cloned_state.__action_mask = self.__action_mask
         cloned_state.winner = self.winner
         cloned_state._draft_cards = self._draft_cards
         cloned_state.players = tuple([player.clone() for player in self.players])
@@ -25,12 +25,18 @@ class LOCMEnv(gym.Env, ABC):
         self.reward_functions = tuple([parse_reward(function_name)() for function_name in reward_functions])
         self.reward_weights = reward_weights
 
+        # reward functions paired with their weights, as used on every step
+        self._weighted_reward_functions = tuple(zip(self.reward_functions, self.reward_weights))
+
         self.last_player_rewards = [None, None]
 
         self.reward_range = (-sum(reward_weights), sum(reward_weights))
 
         self.state = State(seed=seed, items=items, k=k, n=n)
 
+        # last state encoded, its version and its encoding
+        self._last_encoding = None, None, None
+
     def seed(self, seed=None):
         """Sets a seed for random choices in the game."""
         self._seed = seed
@@ -341,58 +347,115 @@ class LOCMEnv(gym.Env, ABC):
         except IndexError:
             raise MalformedActionError("Invalid action number")
 
+    # the card encodings below are their raw attributes divided, feature
+    # by feature, by these; kept apart so that encoders can normalize
+    # many cards at once
+    card_divisors = (1.0,) * 4 + (12.0,) * 5 + (2.0,) + (1.0,) * 6
+    friendly_card_on_board_divisors = (12.0,) * 2 + (1.0,) * 7
+    enemy_card_on_board_divisors = (12.0,) * 2 + (1.0,) * 6
+
+    @staticmethod
+    def card_attributes(card):
+        """Gets the raw (not normalized) features of a card: its type (one-hot),
+        cost, attack, defense, player hp, enemy hp, card draw and keywords."""
+        card_type, keywords = card.type, card.keywords
+
+        return (card_type == 0, card_type == 1, card_type == 2, card_type == 3,
+                card.cost, card.attack, max(-12, card.defense),
+                card.player_hp, card.enemy_hp, card.card_draw,
+                'B' in keywords, 'C' in keywords, 'D' in keywords,
+                'G' in keywords, 'L' in keywords, 'W' in keywords)
+
+    @staticmethod
+    def friendly_card_on_board_attributes(card: Creature):
+        """Gets the raw (not normalized) features of a friendly creature:
+        its attack, defense, whether it can attack and keywords."""
+        keywords = card.keywords
+
+        return (card.attack, card.defense,
+                card.can_attack and not card.has_attacked_this_turn,
+                'B' in keywords, 'C' in keywords, 'D' in keywords,
+                'G' in keywords, 'L' in keywords, 'W' in keywords)
+
+    @staticmethod
+    def enemy_card_on_board_attributes(card: Creature):
+        """Gets the raw (not normalized) features of an enemy creature:
+        its attack, defense and keywords."""
+        keywords = card.keywords
+
+        return (card.attack, card.defense,
+                'B' in keywords, 'C' in keywords, 'D' in keywords,
+                'G' in keywords, 'L' in keywords, 'W' in keywords)
+
     @staticmethod
     def encode_card(card):
         """Encodes a card object into a numerical array."""
-        card_type = [1.0 if isinstance(card, card_type) else 0.0
-                     for card_type in LOCMEnv.card_types]
-        cost = card.cost / 12
-        attack = card.attack / 12
-        defense = max(-12, card.defense) / 12
-        keywords = list(map(int, map(card.keywords.__contains__, 'BCDGLW')))
-        player_hp = card.player_hp / 12
-        enemy_hp = card.enemy_hp / 12
-        card_draw = card.card_draw / 2
-
-        return card_type + [cost, attack, defense, player_hp,
-                            enemy_hp, card_draw] + keywords
+        return [attribute / divisor for attribute, divisor
+                in zip(LOCMEnv.card_attributes(card), LOCMEnv.card_divisors)]
 
     @staticmethod
     def encode_friendly_card_on_board(card: Creature):
         """Encodes a card object into a numerical array."""
-        attack = card.attack / 12
-        defense = card.defense / 12
-        can_attack = int(card.can_attack and not card.has_attacked_this_turn)
-        keywords = list(map(int, map(card.keywords.__contains__, 'BCDGLW')))
-
-        return [attack, defense, can_attack] + keywords
+        return [attribute / divisor for attribute, divisor
+                in zip(LOCMEnv.friendly_card_on_board_attributes(card),
+                       LOCMEnv.friendly_card_on_board_divisors)]
 
     @staticmethod
     def encode_enemy_card_on_board(card: Creature):
         """Encodes a card object into a numerical array."""
-        attack = card.attack / 12
-        defense = card.defense / 12
-        keywords = list(map(int, map(card.keywords.__contains__, 'BCDGLW')))
-
-        return [attack, defense] + keywords
+        return [attribute / divisor for attribute, divisor
+                in zip(LOCMEnv.enemy_card_on_board_attributes(card),
+                       LOCMEnv.enemy_card_on_board_divisors)]
 
     @staticmethod
-    def encode_players(current, opposing):
-        return current.health / 30, \
-               current.mana / 13, \
-               current.next_rune / 30, \
-               (1 + current.bonus_draw) / 6, \
-               opposing.health / 30, \
-               (opposing.base_mana + opposing.bonus_mana) / 13, \
-               opposing.next_rune / 30, \
-               (1 + opposing.bonus_draw) / 6
+    def encode_players(current, opposing, out=None):
+        """Encodes both players' info into eight numbers. If `out` is
+        given, they are written into it instead of returned as a tuple."""
+        if out is None:
+            return current.health / 30, \
+                   current.mana / 13, \
+                   current.next_rune / 30, \
+                   (1 + current.bonus_draw) / 6, \
+                   opposing.health / 30, \
+                   (opposing.base_mana + opposing.bonus_mana) / 13, \
+                   opposing.next_rune / 30, \
+                   (1 + opposing.bonus_draw) / 6
+
+        out[0] = current.health / 30
+        out[1] = current.mana / 13
+        out[2] = current.next_rune / 30
+        out[3] = (1 + current.bonus_draw) / 6
+        out[4] = opposing.health / 30
+        out[5] = (opposing.base_mana + opposing.bonus_mana) / 13
+        out[6] = opposing.next_rune / 30
+        out[7] = (1 + opposing.bonus_draw) / 6
+
+        return out
 
     def encode_state(self):
         """ Encodes a state object into a numerical matrix. """
-        if self.state.phase == Phase.DRAFT:
-            return self._encode_state_draft()
-        elif self.state.phase == Phase.BATTLE:
-            return self._encode_state_battle()
+        state = self.state
+
+        # reuse the previous encoding if the state hasn't changed since
+        last_state, last_version, encoded_state = self._last_encoding
+
+        if state is last_state and state.version == last_version:
+            return encoded_state.copy()
+
+        if state.phase == Phase.DRAFT:
+            encoded_state = self._encode_state_draft()
+        elif state.phase == Phase.BATTLE:
+            encoded_state = self._encode_state_battle()
+        else:
+            encoded_state = None
+
+        # some envs don't encode some of the phases
+        if encoded_state is None:
+            return None
+
+        self._last_encoding = state, state.version, encoded_state
+
+        return encoded_state.copy()
 
     @abstractmethod
     def _encode_state_draft(self):
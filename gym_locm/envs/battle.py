@@ -6,13 +6,20 @@ from gym_locm.engine import Phase, Action, PlayerOrder
 from gym_locm.envs.base_env import LOCMEnv
 from gym_locm.exceptions import GameIsEndedError, MalformedActionError
 
+# enum members bound once, as they are used in every step
+_FIRST = PlayerOrder.FIRST
+_SECOND = PlayerOrder.SECOND
+_DRAFT_PHASE = Phase.DRAFT
+_BATTLE_PHASE = Phase.BATTLE
+
 
 class LOCMBattleEnv(LOCMEnv):
     metadata = {'render.modes': ['text', 'native']}
 
     def __init__(self,
                  draft_agents=(RandomDraftAgent(), RandomDraftAgent()),
-                 return_action_mask=False, seed=None, items=True, k=3, n=30,
+                 return_action_mask=False,
+                 seed=None, items=True, k=3, n=30,
                  reward_functions=('win-loss',), reward_weights=(1.0,)):
         super().__init__(seed=seed, items=items, k=k, n=n,
                          reward_functions=reward_functions, reward_weights=reward_weights)
@@ -44,6 +51,57 @@ class LOCMBattleEnv(LOCMEnv):
             low=-1.0, high=1.0, shape=(self.state_shape,), dtype=np.float32
         )
 
+        # preallocated buffer the state is encoded into at every step
+        self._state_buf = np.zeros(self.state_shape, dtype=np.float32)
+
+        # if not using items, clip card type features
+        self._first_card_feature = 0 if self.items else 4
+
+        # raw features of the cards in hand seen so far, by card id
+        self._card_cache = {}
+
+        # encoder and slots (as a 2d view of the state buffer) of the hand
+        # and of each lane, in the order they appear in the encoded state
+        hand_offset = player_features * 2
+        friendly_board_offset = hand_offset + cards_in_hand * card_features
+        enemy_board_offset = friendly_board_offset \
+            + friendly_cards_on_board * friendly_board_card_features
+
+        def slots(offset, amount, features):
+            return self._state_buf[offset:offset + amount * features].reshape(amount, features)
+
+        friendly_lane_slots = friendly_cards_on_board // 2
+        enemy_lane_slots = enemy_cards_on_board // 2
+        friendly_lane_size = friendly_lane_slots * friendly_board_card_features
+        enemy_lane_size = enemy_lane_slots * enemy_board_card_features
+
+        self._segments = (
+            (self._encode_card_in_hand,
+             slots(hand_offset, cards_in_hand, card_features)),
+            (self.friendly_card_on_board_attributes,
+             slots(friendly_board_offset, friendly_lane_slots,
+                   friendly_board_card_features)),
+            (self.friendly_card_on_board_attributes,
+             slots(friendly_board_offset + friendly_lane_size, friendly_lane_slots,
+                   friendly_board_card_features)),
+            (self.enemy_card_on_board_attributes,
+             slots(enemy_board_offset, enemy_lane_slots, enemy_board_card_features)),
+            (self.enemy_card_on_board_attributes,
+             slots(enemy_board_offset + enemy_lane_size, enemy_lane_slots,
+                   enemy_board_card_features))
+        )
+
+        # cards are first encoded with their raw attributes, then all of
+        # them are normalized at once by the divisors of the base encoders
+        # (player features are written already normalized)
+        self._state_divisors = np.array(
+            (1.0,) * (player_features * 2)
+            + self.card_divisors[self._first_card_feature:] * cards_in_hand
+            + self.friendly_card_on_board_divisors * friendly_cards_on_board
+            + self.enemy_card_on_board_divisors * enemy_cards_on_board,
+            dtype=np.float32
+        )
+
         if self.items:
             # 145 possible actions
             self.action_space = gym.spaces.Discrete(145)
@@ -52,16 +110,15 @@ class LOCMBattleEnv(LOCMEnv):
             self.action_space = gym.spaces.Discrete(41)
 
         # play through draft
-        while self.state.phase == Phase.DRAFT:
-            for agent in self.draft_agents:
-                action = agent.act(self.state)
-
-                self.state.act(action)
+        self._play_draft()
 
     def step(self, action):
         """Makes an action in the game."""
+        # less property accesses
+        state = self.state
+
         # if the battle is finished, there should be no more actions
-        if self._battle_is_finished:
+        if state.phase > _BATTLE_PHASE:
             raise GameIsEndedError()
 
         # check if an action object or an integer was passed
@@ -76,12 +133,12 @@ class LOCMBattleEnv(LOCMEnv):
 
             action = self.decode_action(action)
 
-        # less property accesses
-        state = self.state
+        last_player_rewards = self.last_player_rewards
+        weighted_reward_functions = self._weighted_reward_functions
 
-        self.last_player_rewards[state.current_player.id] = \
-            [weight * function.calculate(state, for_player=PlayerOrder.FIRST)
-             for function, weight in zip(self.reward_functions, self.reward_weights)]
+        last_player_rewards[state.current_player.id] = \
+            [weight * function.calculate(state, for_player=_FIRST)
+             for function, weight in weighted_reward_functions]
 
         # execute the action
         if action is not None:
@@ -89,15 +146,15 @@ class LOCMBattleEnv(LOCMEnv):
         else:
             state.was_last_action_invalid = True
 
-        reward_before = self.last_player_rewards[state.current_player.id]
-        reward_after = [weight * function.calculate(state, for_player=PlayerOrder.FIRST)
-                        for function, weight in zip(self.reward_functions, self.reward_weights)]
+        reward_before = last_player_rewards[state.current_player.id]
+        reward_after = [weight * function.calculate(state, for_player=_FIRST)
+                        for function, weight in weighted_reward_functions]
 
         # build return info
         winner = state.winner
 
         if reward_before is None:
-            raw_rewards = (0.0,) * len(self.reward_functions)
+            raw_rewards = (0.0,) * len(weighted_reward_functions)
         else:
             raw_rewards = tuple([after - before for before, after in zip(reward_before, reward_after)])
 
@@ -110,7 +167,7 @@ class LOCMBattleEnv(LOCMEnv):
                 'raw_rewards': raw_rewards}
 
         if self.return_action_mask:
-            info['action_mask'] = self.state.action_mask
+            info['action_mask'] = state.action_mask
 
         self.rewards[-1] += reward
 
@@ -130,69 +187,58 @@ class LOCMBattleEnv(LOCMEnv):
             agent.seed(self._seed)
 
         # play through draft
-        while self.state.phase == Phase.DRAFT:
-            for agent in self.draft_agents:
-                self.state.act(agent.act(self.state))
+        self._play_draft()
 
         self.rewards.append(0.0)
 
         return self.encode_state()
 
+    def _play_draft(self):
+        """Plays through the draft with the draft agents."""
+        while self.state.phase == _DRAFT_PHASE:
+            for agent in self.draft_agents:
+                self.state.act(agent.act(self.state))
+
     def _encode_state_draft(self):
         pass
 
-    def _encode_state_battle(self):
-        encoded_state = np.full(self.state_shape, 0, dtype=np.float32)
-
-        p0, p1 = self.state.current_player, self.state.opposing_player
-
-        def fill_cards(card_list, up_to, features):
-            remaining_cards = up_to - len(card_list)
-
-            return card_list + [[0] * features for _ in range(remaining_cards)]
-
-        all_cards = []
-
-        # convert all cards in hand to features
-        hand = list(map(self.encode_card, p0.hand))
-
-        # if not using items, clip card type features
-        if not self.items:
-            hand = list(map(lambda c: c[4:], hand))
+    def _encode_card_in_hand(self, card):
+        """Gets the raw features of a card in hand, reusing them if the
+        same card was seen before."""
+        # cards in hand are never modified, so their id suffices as key
+        try:
+            return self._card_cache[card.id]
+        except KeyError:
+            attributes = self.card_attributes(card)[self._first_card_feature:]
 
-        # add dummy cards up to the card limit
-        hand = fill_cards(hand, up_to=8, features=16 if self.items else 12)
+            encoded_card = np.array(attributes, dtype=np.float32)
+            encoded_card.flags.writeable = False
 
-        # add to card list
-        all_cards.extend([feature for card in hand for feature in card])
+            self._card_cache[card.id] = encoded_card
 
-        # in current player's lanes
-        for location in (p0.lanes[0], p0.lanes[1]):
-            # convert all cards to features
-            location = list(map(self.encode_friendly_card_on_board, location))
+            return encoded_card
 
-            # add dummy cards up to the card limit
-            location = fill_cards(location, up_to=3, features=9)
+    def _encode_state_battle(self):
+        encoded_state = self._state_buf
 
-            # add to card list
-            all_cards.extend([feature for card in location for feature in card])
+        # empty slots are left as zeros
+        encoded_state.fill(0.0)
 
-        # in opposing player's lanes
-        for location in (p1.lanes[0], p1.lanes[1]):
-            # convert all cards to features
-            location = list(map(self.encode_enemy_card_on_board, location))
+        p0, p1 = self.state.current_player, self.state.opposing_player
 
-            # add dummy cards up to the card limit
-            location = fill_cards(location, up_to=3, features=8)
+        # players info
+        self.encode_players(p0, p1, out=encoded_state[:8])
 
-            # add to card list
-            all_cards.extend([feature for card in location for feature in card])
+        locations = p0.hand, p0.lanes[0], p0.lanes[1], p1.lanes[0], p1.lanes[1]
 
-        # players info
-        encoded_state[:8] = self.encode_players(p0, p1)
-        encoded_state[8:] = np.array(all_cards).flatten()
+        # cards in current player's hand, then in each lane
+        for location, (encoder, slots) in zip(locations, self._segments):
+            for i, card in enumerate(location):
+                slots[i] = encoder(card)
 
-        return encoded_state
+        # normalize all features at once; this also copies the buffer,
+        # which will be overwritten on the next step
+        return encoded_state / self._state_divisors
 
     def get_episode_rewards(self):
         return self.rewards
@@ -229,7 +275,7 @@ class LOCMBattleSingleEnv(LOCMBattleEnv):
 
         # if playing second, have first player play
         if not self.play_first:
-            while self.state.current_player.id != PlayerOrder.SECOND:
+            while self.state.current_player.id != _SECOND:
                 super().step(self.battle_agent.act(self.state))
 
         self.rewards_single_player.append(0.0)
@@ -295,8 +341,9 @@ class LOCMBattleSelfPlayEnv(LOCMBattleEnv):
 
         # if playing second, have first player play
         if not self.play_first:
-            while self.state.current_player.id != PlayerOrder.SECOND:
-                state = self.encode_state()
+            state = encoded_state
+
+            while self.state.current_player.id != _SECOND:
                 action = self.adversary_policy(state)
 
                 state, reward, done, info = super().step(action)
@@ -319,8 +366,8 @@ class LOCMBattleSelfPlayEnv(LOCMBattleEnv):
         was_invalid = info['invalid']
 
         # have opponent play until its player's turn or there's a winner
+        # (the last observation returned is the adversary's current one)
         while self.state.current_player.id != player and self.state.winner is None:
-            state = self.encode_state()
             action = self.adversary_policy(state)
 
             state, reward, done, info = super().step(action)
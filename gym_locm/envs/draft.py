@@ -1,3 +1,7 @@
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union
 
 import gym
@@ -6,6 +10,45 @@ from gym_locm.agents import *
 from gym_locm.engine import *
 from gym_locm.envs.base_env import LOCMEnv
 
+# enum members bound once, as they are used in every step
+_FIRST = PlayerOrder.FIRST
+_DRAFT_PHASE = Phase.DRAFT
+
+
+# battle agents of the current worker process, set by its pool initializer
+_worker_battle_agents = None
+
+
+def _init_worker(battle_agents):
+    """Keeps the battle agents in a worker process, so that they are sent
+    to it only once, instead of with every battle."""
+    global _worker_battle_agents
+
+    _worker_battle_agents = battle_agents
+
+
+def _run_match(state, seed):
+    """Plays a battle until its end in a worker process."""
+    battle_agents = _worker_battle_agents
+
+    # all workers get copies of the agents with the same random state,
+    # so they are reseeded to not play identical battles
+    random.seed(seed)
+
+    for agent in battle_agents:
+        agent.seed(seed)
+        agent.reset()
+
+    # while the game doesn't end, get agents acting alternatively
+    while state.winner is None:
+        agent = battle_agents[state.current_player.id]
+
+        action = agent.act(state)
+
+        state.act(action)
+
+    return state.winner
+
 
 class LOCMDraftEnv(LOCMEnv):
     metadata = {'render.modes': ['text', 'native']}
@@ -15,14 +58,16 @@ class LOCMDraftEnv(LOCMEnv):
                  use_draft_history=False, use_mana_curve=False,
                  sort_cards=False, evaluation_battles=1,
                  seed=None, items=True, k=3, n=30,
-                 reward_functions=('win-loss',), reward_weights=(1.0,)):
+                 reward_functions=('win-loss',), reward_weights=(1.0,),
+                 battle_processes=None):
         super().__init__(seed=seed, items=items, k=k, n=n,
                          reward_functions=reward_functions, reward_weights=reward_weights)
 
         # init bookkeeping structures
         self.results = []
         self.choices = ([], [])
-        self.draft_ordering = list(range(3))
+        self._default_ordering = list(range(self.k))
+        self.draft_ordering = self._default_ordering[:]
 
         self.battle_agents = battle_agents
 
@@ -30,6 +75,11 @@ class LOCMDraftEnv(LOCMEnv):
             battle_agent.seed(seed)
 
         self.evaluation_battles = evaluation_battles
+
+        # evaluation battles are run in parallel only if explicitly asked,
+        # and only if more than one worker process would be used
+        self._battle_workers = min(battle_processes or 1, evaluation_battles, os.cpu_count() or 1)
+        self._pool, self._pool_agents = None, None
         self.sort_cards = sort_cards
         self.use_draft_history = use_draft_history
         self.use_mana_curve = use_mana_curve
@@ -44,6 +94,20 @@ class LOCMDraftEnv(LOCMEnv):
 
         self.state_shape = self.state_shape,
 
+        def card_slot(position):
+            lo = position * self.card_features
+            hi = lo + self.card_features
+
+            return slice(lo, hi if hi < 0 else None)
+
+        # slices of the encoded state where the current card choices and
+        # the past choices go, respectively
+        self._choice_slots = [card_slot(-(self.k - i)) for i in range(self.k)]
+        self._history_slots = [card_slot(-(self.n + self.k - j)) for j in range(self.n)]
+
+        # encodings of the cards seen so far, by card id
+        self._card_cache = {}
+
         self.observation_space = gym.spaces.Box(
             low=-1.0, high=1.0,
             shape=self.state_shape,
@@ -66,7 +130,7 @@ class LOCMDraftEnv(LOCMEnv):
         # empty bookkeeping structures
         self.results = []
         self.choices = ([], [])
-        self.draft_ordering = list(range(3))
+        self.draft_ordering = self._default_ordering[:]
 
         # reset all agents' internal state
         for agent in self.battle_agents:
@@ -77,8 +141,11 @@ class LOCMDraftEnv(LOCMEnv):
 
     def step(self, action: Union[int, Action]) -> (np.array, int, bool, dict):
         """Makes an action in the game."""
+        # less property accesses
+        state = self.state
+
         # if the draft is finished, there should be no more actions
-        if self._draft_is_finished:
+        if state.phase > _DRAFT_PHASE:
             raise GameIsEndedError()
 
         # check if an action object or an integer was passed
@@ -93,13 +160,14 @@ class LOCMDraftEnv(LOCMEnv):
 
             action = self.decode_action(action)
 
-        # less property accesses
-        state = self.state
-        current_player_id = state.current_player.id
+        current_player = state.current_player
+        current_player_id = current_player.id
+        last_player_rewards = self.last_player_rewards
+        weighted_reward_functions = self._weighted_reward_functions
 
-        self.last_player_rewards[state.current_player.id] = \
+        last_player_rewards[current_player_id] = \
             [weight * function.calculate(state, for_player=current_player_id)
-             for function, weight in zip(self.reward_functions, self.reward_weights)]
+             for function, weight in weighted_reward_functions]
 
         # find appropriate value for the provided card index
         if 0 <= action.origin < self.k:
@@ -108,15 +176,15 @@ class LOCMDraftEnv(LOCMEnv):
             chosen_index = 0
 
         # find chosen card and keep track of it
-        chosen_card = state.current_player.hand[chosen_index]
-        self.choices[state.current_player.id].append(chosen_card)
+        chosen_card = current_player.hand[chosen_index]
+        self.choices[current_player_id].append(chosen_card)
 
         # execute the action
         state.act(action)
 
-        reward_before = self.last_player_rewards[state.current_player.id]
+        reward_before = last_player_rewards[state.current_player.id]
         reward_after = [weight * function.calculate(state, for_player=current_player_id)
-                        for function, weight in zip(self.reward_functions, self.reward_weights)]
+                        for function, weight in weighted_reward_functions]
 
         # init return info
         done = False
@@ -125,35 +193,37 @@ class LOCMDraftEnv(LOCMEnv):
                 'winner': []}
 
         # if draft is now ended, evaluation should be done
-        if self._draft_is_finished:
+        if state.phase > _DRAFT_PHASE:
             # faster evaluation method for when only one battle is required
             # todo: check if this optimization is still necessary
             if self.evaluation_battles == 1:
                 winner = self.do_match(state)
 
-                self.results = [1 if winner == PlayerOrder.FIRST else -1]
+                self.results = [1 if winner == _FIRST else -1]
                 info['winner'] = [winner]
             else:
-                # for each evaluation battle required, copy the current
-                # start-of-battle state and do battle
-                for i in range(self.evaluation_battles):
-                    state_copy = self.state.clone()
+                if self._battle_workers > 1:
+                    winners = self._do_matches_in_parallel(state)
+                else:
+                    winners = self._do_matches(state)
 
-                    winner = self.do_match(state_copy)
-
-                    self.results.append(1 if winner == PlayerOrder.FIRST else -1)
-                    info['winner'].append(winner)
+                info['winner'] = winners
+                self.results = [1 if winner == _FIRST else -1 for winner in winners]
 
             try:
                 win_loss_reward_index = self.reward_functions.index("win-loss")
-                reward_after[win_loss_reward_index] = np.mean(self.results)
+                results = self.results
+
+                # plain python is faster than numpy for such small lists
+                reward_after[win_loss_reward_index] = \
+                    results[0] if len(results) == 1 else sum(results) / len(results)
             except ValueError:
                 pass
 
             done = True
 
         if reward_before is None:
-            raw_rewards = (0.0,) * len(self.reward_functions)
+            raw_rewards = (0.0,) * len(weighted_reward_functions)
         else:
             raw_rewards = tuple([after - before for before, after in zip(reward_before, reward_after)])
 
@@ -177,6 +247,41 @@ class LOCMDraftEnv(LOCMEnv):
 
         return state.winner
 
+    def _do_matches(self, state):
+        # for each evaluation battle required, copy the current
+        # start-of-battle state and do battle
+        return [self.do_match(state.clone()) for _ in range(self.evaluation_battles)]
+
+    def _do_matches_in_parallel(self, state):
+        """Runs the evaluation battles in worker processes. Unlike the
+        sequential battles, each one is played with freshly seeded agents."""
+        # the workers hold copies of the agents, so a new pool is needed
+        # if the agents were replaced
+        if self._pool is not None and self._pool_agents is not self.battle_agents:
+            self.close()
+
+        if self._pool is None:
+            # daemonic processes (e.g. vec env workers) can't have children
+            if multiprocessing.current_process().daemon:
+                return self._do_matches(state)
+
+            # spawn avoids forking a process that loaded tensorflow or torch
+            self._pool = ProcessPoolExecutor(max_workers=self._battle_workers,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker,
+                                             initargs=(self.battle_agents,))
+            self._pool_agents = self.battle_agents
+
+        states = [state.clone() for _ in range(self.evaluation_battles)]
+        seeds = [random.getrandbits(32) for _ in range(self.evaluation_battles)]
+
+        return list(self._pool.map(_run_match, states, seeds))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool, self._pool_agents = None, None
+
     def _render_text_ended(self):
         if len(self.results) == 1:
             super()._render_text_ended()
@@ -185,44 +290,52 @@ class LOCMDraftEnv(LOCMEnv):
 
             print(f'P0: {wins_by_p0}%; P1: {100 - wins_by_p0}%')
 
+    def _encode_card_in_draft(self, card):
+        """Encodes a card, reusing its encoding if the same card was
+        seen before."""
+        # cards are not modified during the draft, so their id suffices as key
+        try:
+            return self._card_cache[card.id]
+        except KeyError:
+            encoded_card = np.array(self.encode_card(card), dtype=np.float32)
+            encoded_card.flags.writeable = False
+
+            self._card_cache[card.id] = encoded_card
+
+            return encoded_card
+
     def _encode_state_draft(self):
-        encoded_state = np.full(self.state_shape, 0, dtype=np.float32)
+        encoded_state = np.zeros(self.state_shape, dtype=np.float32)
 
         chosen_cards = self.choices[self.state.current_player.id]
 
         if not self._draft_is_finished:
             card_choices = self.state.current_player.hand[0:self.k]
 
-            self.draft_ordering = list(range(self.k))
-
             if self.sort_cards:
-                sorted_cards = sorted(self.draft_ordering,
-                                      key=lambda p: card_choices[p].id)
+                ids = [card.id for card in card_choices]
 
-                self.draft_ordering = list(sorted_cards)
+                self.draft_ordering = sorted(self._default_ordering, key=ids.__getitem__)
+            else:
+                self.draft_ordering = self._default_ordering[:]
 
             for i in range(len(card_choices)):
                 index = self.draft_ordering[i]
-                lo = -(self.k - i) * self.card_features
-                hi = lo + self.card_features
-                hi = hi if hi < 0 else None
 
-                encoded_state[lo:hi] = self.encode_card(card_choices[index])
+                encoded_state[self._choice_slots[i]] = self._encode_card_in_draft(card_choices[index])
 
         if self.use_draft_history:
             if self.sort_cards:
                 chosen_cards = sorted(chosen_cards, key=lambda c: c.id)
 
             for j, card in enumerate(chosen_cards):
-                lo = -(self.n + self.k - j) * self.card_features
-                hi = lo + self.card_features
-                hi = hi if hi < 0 else None
-
-                encoded_state[lo:hi] = self.encode_card(card)
+                encoded_state[self._history_slots[j]] = self._encode_card_in_draft(card)
 
         if self.use_mana_curve:
-            for chosen_card in chosen_cards:
-                encoded_state[chosen_card.cost] += 1
+            costs = np.fromiter((card.cost for card in chosen_cards),
+                                dtype=np.intp, count=len(chosen_cards))
+
+            encoded_state[:13] += np.bincount(costs, minlength=13)
 
         return encoded_state
 
@@ -306,4 +419,5 @@ class LOCMDraftSingleTabularEnv(LOCMDraftSingleEnv):
         self.observation_space = gym.spaces.MultiDiscrete((160, 160, 160))
 
     def _encode_state_draft(self):
-        return np.array(sorted(map(attrgetter('id'), self.state.current_player.hand))) - 1
+        # for three cards, sorting in python beats any numpy round-trip
+        return np.array(sorted([card.id - 1 for card in self.state.current_player.hand]))
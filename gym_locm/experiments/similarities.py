@@ -1,6 +1,7 @@
 import argparse
 import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -38,8 +39,9 @@ def run():
 
     print("Reading data...")
 
-    # read all csv choices files
-    dfs = [pd.read_csv(file, header=[0, 1]) for file in args.files]
+    # read all csv choices files, overlapping their disk reads
+    with ThreadPoolExecutor(max_workers=min(len(args.files), os.cpu_count() or 1)) as executor:
+        dfs = list(executor.map(lambda file: pd.read_csv(file, header=[0, 1]), args.files))
 
     # if more than one file was read, concat them
     if len(dfs) > 1:
@@ -59,40 +61,25 @@ def run():
 
     print("Processing data...")
 
-    # concat 1st and 2nd players' choices into a new dataframe
-    temp = pd.DataFrame(index=range(len(choices.index) * 2), columns=drafters)
-    for drafter in drafters:
-        drafter_columns = [choices[(drafter, '1st')], choices[(drafter, '2nd')]]
-
-        temp[drafter] = pd.concat(drafter_columns, ignore_index=True)
+    # concat 1st and 2nd players' choices into a new dataframe, built at once
+    # from the stacked columns instead of one series concat per drafter
+    temp = {drafter: np.concatenate([choices[(drafter, '1st')].to_numpy(),
+                                     choices[(drafter, '2nd')].to_numpy()])
+            for drafter in drafters}
 
     # discard original dataframe in favor of the new one
-    choices = temp
+    choices = pd.DataFrame(temp, columns=drafters)
 
     print("Calculating similarities...")
 
-    # initialize the similarities dataframe
-    similarities = pd.DataFrame(index=drafters, columns=drafters)
-
-    # populate the similarities dataframe
-    total_rows = len(choices.index)
-    for drafter1 in drafters:
-        # the similarity of a drafter and itself is of 100%
-        similarities[drafter1][drafter1] = 1.0
-
-        for drafter2 in drafters:
-            if drafter1 == drafter2:
-                continue
-
-            # calculate amount of equal choices
-            equal_rows = (choices[drafter1] == choices[drafter2]).sum()
-
-            # calculate similarity
-            similarity = equal_rows / total_rows
+    # count the equal choices of each drafter against all others at once
+    # (the similarity of a drafter and itself is of 100%)
+    values = choices.to_numpy()
+    equal_rows = [(values == values[:, [i]]).sum(axis=0) for i in range(len(drafters))]
 
-            # update appropriate cells in the dataframe
-            similarities[drafter2][drafter1] = similarity
-            similarities[drafter1][drafter2] = similarity
+    # build the similarities dataframe
+    similarities = pd.DataFrame(np.array(equal_rows) / len(choices.index),
+                                index=drafters, columns=drafters)
 
     # save similarities dataframe to files
     similarities.to_pickle(args.path + '/similarities.pkl')
@@ -1,10 +1,12 @@
 import argparse
 import logging
+import multiprocessing
 import os
 import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from statistics import mean
+from itertools import repeat
 from typing import Tuple, List
 
 import numpy as np
@@ -52,6 +54,9 @@ def get_arg_parser() -> argparse.ArgumentParser:
                         'repeated with each seed')
     p.add_argument('--concurrency', '-c', type=int, default=1,
                    help='amount of concurrent games')
+    p.add_argument('--processes', type=int, default=1,
+                   help='amount of seeds whose match-ups are run in '
+                        'parallel, each in its own process')
     p.add_argument('--path', '-p', '-o', default='.',
                    help='path to save result files')
 
@@ -125,7 +130,8 @@ def run_matchup(drafter1: str, drafter2: str, battler: str, games: int,
 
     # initialize metrics
     episodes_so_far = 0
-    episode_rewards = [[0.0] for _ in range(env.num_envs)]
+    current_rewards = np.zeros(env.num_envs)
+    episode_rewards = [[] for _ in range(env.num_envs)]
     drafter1.mana_curve = [0 for _ in range(13)]
     drafter2.mana_curve = [0 for _ in range(13)]
     drafter1.choices = [[] for _ in range(env.num_envs)]
@@ -187,16 +193,19 @@ def run_matchup(drafter1: str, drafter2: str, battler: str, games: int,
         if isinstance(current_drafter, agents.RLDraftAgent):
             current_drafter.dones = dones
 
-        # update metrics
-        for i in range(env.num_envs):
-            episode_rewards[i][-1] += rewards[i]
+        # update metrics of all envs at once
+        current_rewards += rewards
 
-            if dones[i]:
-                episode_rewards[i].append(0.0)
-                current_drafter.decks[i].append([])
-                other_drafter.decks[i].append([])
+        # then save the metrics of the episodes that just ended
+        done_indices = np.flatnonzero(dones)
 
-                episodes_so_far += 1
+        for i in done_indices:
+            episode_rewards[i].append(float(current_rewards[i]))
+            current_drafter.decks[i].append([])
+            other_drafter.decks[i].append([])
+
+        current_rewards[done_indices] = 0.0
+        episodes_so_far += len(done_indices)
 
         # check exiting condition
         if episodes_so_far >= games:
@@ -212,7 +221,7 @@ def run_matchup(drafter1: str, drafter2: str, battler: str, games: int,
 
     # join all parallel rewards
     all_rewards = [reward for rewards in episode_rewards
-                   for reward in rewards[:-1]]
+                   for reward in rewards]
 
     # join all parallel choices
     drafter1.choices = [c for choices in drafter1.choices for c in choices]
@@ -234,7 +243,7 @@ def run_matchup(drafter1: str, drafter2: str, battler: str, games: int,
     alternatives = alternatives[:30 * games]
 
     # convert the list of rewards to the first player's win rate
-    win_rate = (mean(all_rewards) + 1) * 50
+    win_rate = (np.mean(all_rewards) + 1) * 50
 
     return (win_rate, 100 - win_rate), \
         (drafter1.mana_curve, drafter2.mana_curve), \
@@ -285,82 +294,101 @@ def run():
         columns=['timestamp', 'reward'] + list(range(30)) + list(range(30))
     )
 
-    # for each combination of two drafters
-    for drafter1 in args.drafters:
-        for drafter2 in args.drafters:
-            mean_win_rate = 0
-            mean_mana_curves_1p, mean_mana_curves_2p = [], []
-            choices_1p, choices_2p = [], []
-
-            # for each seed
-            for i, seed in enumerate(args.seeds):
-                # if any drafter is a path to a folder, then select the
-                # appropriate model inside the folder
-                d1 = drafter1 + f'1st/{i + 1}.zip' if drafter1.endswith('/') else drafter1
-                d2 = drafter2 + f'2nd/{i + 1}.zip' if drafter2.endswith('/') else drafter2
-
-                # run the match-up and get the statistics
-                wrs, mcs, chs, alts, dks, rwds = run_matchup(
-                    d1, d2, args.battler, args.games, seed, args.concurrency)
-
-                mean_win_rate += wrs[0]
-                mean_mana_curves_1p.append(mcs[0])
-                mean_mana_curves_2p.append(mcs[1])
-                choices_1p.extend(chs[0])
-                choices_2p.extend(chs[1])
-
-                # save the card alternatives
-                alternatives.loc[seed, :, :] = alts
-
-                # save the episodes info
-                episodes.loc[seed, :, drafter1, drafter2] = \
-                    [[datetime.now(), rwds[i]] + dks[0][i] + dks[1][i] for i in range(len(rwds))]
-
-                # save individual result
-                ind_results.append([drafter1, drafter2, seed,
-                                    wrs[0], datetime.now()])
-
-            # get the mean win rate of the first player
-            mean_win_rate /= len(args.seeds)
-
-            # round the mean win rate up to three decimal places
-            mean_win_rate = round(mean_win_rate, 3)
-
-            # get the current time
-            current_time = datetime.now()
-
-            # print the match-up and its result
-            print(current_time, drafter1, drafter2, mean_win_rate)
-
-            # save aggregate result
-            agg_results.loc[drafter1][drafter2] = mean_win_rate
-
-            # save mana curves and choices if they have not been saved yet
-            if np.isnan(mana_curves.loc[drafter1, '1st'][0]):
-                # get the mean mana curve for the drafter
-                mean_mana_curves_1p = np.array(mean_mana_curves_1p).mean(axis=0)
-
-                # change unit from percentage to amount of cards
-                mean_mana_curves_1p *= 30
-
-                # update appropriate mana curves data frame row
-                mana_curves.loc[drafter1, '1st'] = mean_mana_curves_1p
-
-                # update appropriate choices data frame row
-                choices.loc[drafter1, '1st'] = choices_1p
-
-            if np.isnan(mana_curves.loc[drafter2, '2nd'][0]):
-                # get the mean mana curve for the drafter
-                mean_mana_curves_2p = np.array(mean_mana_curves_2p).mean(axis=0)
-
-                # change unit from percentage to amount of cards
-                mean_mana_curves_2p *= 30
-
-                # update appropriate mana curves data frame row
-                mana_curves.loc[drafter2, '2nd'] = mean_mana_curves_2p
-
-                # update appropriate choices data frame row
-                choices.loc[drafter2, '2nd'] = choices_2p
+    # match-ups with different seeds are independent, so they can be
+    # run in parallel; spawn avoids forking a process that loaded tensorflow
+    if args.processes > 1:
+        executor = ProcessPoolExecutor(max_workers=args.processes,
+                                       mp_context=multiprocessing.get_context('spawn'))
+        map_matchups = executor.map
+    else:
+        executor = None
+        map_matchups = map
+
+    try:
+        # for each combination of two drafters
+        for drafter1 in args.drafters:
+            for drafter2 in args.drafters:
+                mean_win_rate = 0
+                mean_mana_curves_1p, mean_mana_curves_2p = [], []
+                choices_1p, choices_2p = [], []
+
+                drafters1, drafters2 = [], []
+
+                # for each seed
+                for i, seed in enumerate(args.seeds):
+                    # if any drafter is a path to a folder, then select the
+                    # appropriate model inside the folder
+                    drafters1.append(drafter1 + f'1st/{i + 1}.zip' if drafter1.endswith('/') else drafter1)
+                    drafters2.append(drafter2 + f'2nd/{i + 1}.zip' if drafter2.endswith('/') else drafter2)
+
+                # run the match-ups and get the statistics
+                results = map_matchups(run_matchup, drafters1, drafters2,
+                                       repeat(args.battler), repeat(args.games),
+                                       args.seeds, repeat(args.concurrency))
+
+                for seed, (wrs, mcs, chs, alts, dks, rwds) in zip(args.seeds, results):
+                    mean_win_rate += wrs[0]
+                    mean_mana_curves_1p.append(mcs[0])
+                    mean_mana_curves_2p.append(mcs[1])
+                    choices_1p.extend(chs[0])
+                    choices_2p.extend(chs[1])
+
+                    # save the card alternatives
+                    alternatives.loc[seed, :, :] = alts
+
+                    # save the episodes info
+                    episodes.loc[seed, :, drafter1, drafter2] = \
+                        [[datetime.now(), rwds[i]] + dks[0][i] + dks[1][i] for i in range(len(rwds))]
+
+                    # save individual result
+                    ind_results.append([drafter1, drafter2, seed,
+                                        wrs[0], datetime.now()])
+
+                # get the mean win rate of the first player
+                mean_win_rate /= len(args.seeds)
+
+                # round the mean win rate up to three decimal places
+                mean_win_rate = round(mean_win_rate, 3)
+
+                # get the current time
+                current_time = datetime.now()
+
+                # print the match-up and its result
+                print(current_time, drafter1, drafter2, mean_win_rate)
+
+                # save aggregate result
+                agg_results.loc[drafter1][drafter2] = mean_win_rate
+
+                # save mana curves and choices if they have not been saved yet
+                if np.isnan(mana_curves.loc[drafter1, '1st'][0]):
+                    # get the mean mana curve for the drafter
+                    mean_mana_curves_1p = np.array(mean_mana_curves_1p).mean(axis=0)
+
+                    # change unit from percentage to amount of cards
+                    mean_mana_curves_1p *= 30
+
+                    # update appropriate mana curves data frame row
+                    mana_curves.loc[drafter1, '1st'] = mean_mana_curves_1p
+
+                    # update appropriate choices data frame row
+                    choices.loc[drafter1, '1st'] = choices_1p
+
+                if np.isnan(mana_curves.loc[drafter2, '2nd'][0]):
+                    # get the mean mana curve for the drafter
+                    mean_mana_curves_2p = np.array(mean_mana_curves_2p).mean(axis=0)
+
+                    # change unit from percentage to amount of cards
+                    mean_mana_curves_2p *= 30
+
+                    # update appropriate mana curves data frame row
+                    mana_curves.loc[drafter2, '2nd'] = mean_mana_curves_2p
+
+                    # update appropriate choices data frame row
+                    choices.loc[drafter2, '2nd'] = choices_2p
+    finally:
+        # don't leave the worker processes behind if a match-up fails
+        if executor is not None:
+            executor.shutdown()
 
     # add average win rate to aggregate results
     avg_wr_as_1st_player = agg_results.mean(axis=1)
@@ -11,6 +11,15 @@ from gym_locm.envs import rewards
 _counter = 0
 
 
+def positive_int(value):
+    value = int(value)
+
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+
+    return value
+
+
 def get_arg_parser():
     p = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -77,6 +86,9 @@ def get_arg_parser():
                    help="seed to use on the model, envs and training")
     p.add_argument("--concurrency", type=int, default=1,
                    help="amount of environments to use")
+    p.add_argument("--keep-checkpoints", type=positive_int, default=None,
+                   help="amount of most recent model checkpoints to keep; "
+                        "None keeps all")
 
     p.add_argument("--wandb-entity", type=str, default="j-ufmg",
                    help="entity name on W&B")
@@ -196,20 +208,21 @@ def run():
             args.task, model_builder, model_params, env_params, eval_env_params,
             args.train_episodes, args.eval_episodes, args.num_evals,
             args.switch_freq, args.path, args.seed, args.concurrency,
-            wandb_run=run
+            wandb_run=run, keep_checkpoints=args.keep_checkpoints
         )
     elif args.adversary == 'self-play':
         trainer = SelfPlay(
             args.task, model_builder, model_params, env_params, eval_env_params,
             args.train_episodes, args.eval_episodes, args.num_evals,
             args.role, args.switch_freq, args.path, args.seed, args.concurrency,
-            wandb_run=run
+            wandb_run=run, keep_checkpoints=args.keep_checkpoints
         )
     elif args.adversary == 'fixed':
         trainer = FixedAdversary(
             args.task, model_builder, model_params, env_params, eval_env_params,
             args.train_episodes, args.eval_episodes, args.num_evals,
-            args.role, args.path, args.seed, args.concurrency, wandb_run=run
+            args.role, args.path, args.seed, args.concurrency, wandb_run=run,
+            keep_checkpoints=args.keep_checkpoints
         )
     else:
         raise Exception("Invalid adversary")
@@ -73,7 +73,8 @@ def encode_state(game_input):
         state[i] = card_type + [cost, attack, defense, player_hp,
                                 enemy_hp, card_draw] + keywords
 
-    return state.flatten()
+    # state is contiguous, so ravel returns a view instead of a copy
+    return state.ravel()
 
 
 def act(network, state, past_choices):
@@ -3,11 +3,11 @@ import logging
 import math
 import os
 import time
+from collections import deque
 import warnings
 import numpy as np
 from abc import abstractmethod
 from datetime import datetime
-from statistics import mean
 
 # suppress tensorflow deprecated warnings
 warnings.filterwarnings('ignore', category=FutureWarning)
@@ -36,7 +36,7 @@ if verbose:
 
 
 class TrainingSession:
-    def __init__(self, task, params, path, seed, wandb_run=None):
+    def __init__(self, task, params, path, seed, wandb_run=None, keep_checkpoints=None):
         # initialize logger
         self.logger = logging.getLogger('{0}.{1}'.format(__name__,
                                                          type(self).__name__))
@@ -56,10 +56,38 @@ class TrainingSession:
         self.path = os.path.dirname(__file__) + "/../../" + path
         self.seed = seed
 
+        # amount of most recent checkpoints to keep per folder (None keeps all)
+        assert keep_checkpoints is None or keep_checkpoints >= 1, \
+            "keep_checkpoints must be at least 1, or None to keep all checkpoints"
+
+        self.keep_checkpoints = keep_checkpoints
+
+        # paths of the checkpoints saved so far, by folder
+        self._saved_checkpoints = {}
+
     @abstractmethod
     def _train(self):
         pass
 
+    def _save_model(self, model, model_path, **kwargs):
+        """Saves a model checkpoint, deleting the oldest ones in the same
+        folder if more than `keep_checkpoints` checkpoints are there."""
+        # save to a temporary file first, so that an interrupted save
+        # never leaves a truncated checkpoint behind
+        model.save(model_path + '-tmp', **kwargs)
+        os.replace(model_path + '-tmp.zip', model_path + '.zip')
+
+        if self.keep_checkpoints is not None:
+            folder = os.path.dirname(model_path)
+            saved_checkpoints = self._saved_checkpoints.setdefault(folder, deque())
+
+            # the same checkpoint can be saved twice at the end of training
+            if model_path not in saved_checkpoints:
+                saved_checkpoints.append(model_path)
+
+            while len(saved_checkpoints) > self.keep_checkpoints:
+                os.remove(saved_checkpoints.popleft() + '.zip')
+
     def _save_results(self):
         results_path = self.path + '/results.json'
 
@@ -94,9 +122,11 @@ class TrainingSession:
 class FixedAdversary(TrainingSession):
     def __init__(self, task, model_builder, model_params, env_params,
                  eval_env_params, train_episodes, eval_episodes, num_evals,
-                 play_first, path, seed, num_envs=1, wandb_run=None):
+                 play_first, path, seed, num_envs=1, wandb_run=None,
+                 keep_checkpoints=None):
         super(FixedAdversary, self).__init__(
-            task, model_params, path, seed, wandb_run=wandb_run)
+            task, model_params, path, seed, wandb_run=wandb_run,
+            keep_checkpoints=keep_checkpoints)
 
         # log start time
         start_time = time.perf_counter()
@@ -159,7 +189,7 @@ class FixedAdversary(TrainingSession):
         if episodes_so_far >= self.model.next_eval:
             # save model
             model_path = self.path + f'/{episodes_so_far}'
-            self.model.save(model_path)
+            self._save_model(self.model, model_path)
             save_model_as_json(self.model, self.params['activation'], model_path)
             self.logger.debug(f"Saved model at {model_path}.zip/json.")
 
@@ -226,9 +256,11 @@ class FixedAdversary(TrainingSession):
 class SelfPlay(TrainingSession):
     def __init__(self, task, model_builder, model_params, env_params,
                  eval_env_params, train_episodes, eval_episodes, num_evals,
-                 switch_frequency, path, seed, num_envs=1, wandb_run=None):
+                 switch_frequency, path, seed, num_envs=1, wandb_run=None,
+                 keep_checkpoints=None):
         super(SelfPlay, self).__init__(
-            task, model_params, path, seed, wandb_run=wandb_run)
+            task, model_params, path, seed, wandb_run=wandb_run,
+            keep_checkpoints=keep_checkpoints)
 
         # log start time
         start_time = time.perf_counter()
@@ -328,7 +360,7 @@ class SelfPlay(TrainingSession):
             # save model
             model_path = self.path + f'/{episodes_so_far}'
 
-            model.save(model_path)
+            self._save_model(model, model_path)
 
             save_model_as_json(model, self.params['activation'], model_path)
             self.logger.debug(f"Saved model at {model_path}.zip/json.")
@@ -438,9 +470,11 @@ class SelfPlay(TrainingSession):
 class AsymmetricSelfPlay(TrainingSession):
     def __init__(self, task, model_builder, model_params, env_params,
                  eval_env_params, train_episodes, eval_episodes, num_evals,
-                 switch_frequency, path, seed, num_envs=1, wandb_run=None):
+                 switch_frequency, path, seed, num_envs=1, wandb_run=None,
+                 keep_checkpoints=None):
         super(AsymmetricSelfPlay, self).__init__(
-            task, model_params, path, seed, wandb_run=wandb_run)
+            task, model_params, path, seed, wandb_run=wandb_run,
+            keep_checkpoints=keep_checkpoints)
 
         # log start time
         start_time = time.perf_counter()
@@ -545,7 +579,7 @@ class AsymmetricSelfPlay(TrainingSession):
             # save model
             model_path = f'{self.path}/role{model.role_id}/{episodes_so_far}'
 
-            model.save(model_path)
+            self._save_model(model, model_path)
 
             save_model_as_json(model, self.params['activation'], model_path)
             self.logger.debug(f"Saved model at {model_path}.zip/json.")
@@ -680,6 +714,13 @@ class Evaluator:
         self.episodes = episodes
         self.seed = seed
 
+        # initialize metrics buffers, reused by every evaluation
+        self._current_rewards = np.zeros(self.env.num_envs)
+        self._current_lengths = np.zeros(self.env.num_envs, dtype=np.int64)
+        self._episode_rewards = [[] for _ in range(self.env.num_envs)]
+        self._episode_lengths = [[] for _ in range(self.env.num_envs)]
+        self._episode_turns = [[] for _ in range(self.env.num_envs)]
+
         # log end time
         end_time = time.perf_counter()
 
@@ -711,11 +752,20 @@ class Evaluator:
 
         # initialize metrics
         episodes_so_far = 0
-        episode_rewards = [[0.0] for _ in range(self.env.num_envs)]
-        episode_lengths = [[0] for _ in range(self.env.num_envs)]
-        episode_turns = [[] for _ in range(self.env.num_envs)]
+        current_rewards, current_lengths = self._current_rewards, self._current_lengths
+        episode_rewards = self._episode_rewards
+        episode_lengths = self._episode_lengths
+        episode_turns = self._episode_turns
         action_histogram = [0] * self.env.action_space.n
 
+        # clear the metrics of the last evaluation
+        current_rewards.fill(0.0)
+        current_lengths.fill(0)
+
+        for episode_metrics in (episode_rewards, episode_lengths, episode_turns):
+            for env_metrics in episode_metrics:
+                env_metrics.clear()
+
         # run the episodes
         while True:
             # get the agent's action for all parallel envs
@@ -729,24 +779,30 @@ class Evaluator:
                 observations = self.env.get_attr('state')
                 actions = [agent.act(observation) for observation in observations]
 
-            # update the action histogram
+            # send the actions to the envs
+            self.env.step_async(actions)
+
+            # update the action histogram while the envs step
             for action in actions:
                 action_histogram[action] += 1
 
-            # perform the action and get the outcome
-            observations, rewards, dones, infos = self.env.step(actions)
+            # get the outcome
+            observations, rewards, dones, infos = self.env.step_wait()
 
-            # update metrics
-            for i in range(self.env.num_envs):
-                episode_rewards[i][-1] += rewards[i]
-                episode_lengths[i][-1] += 1
+            # update metrics of all envs at once
+            current_rewards += rewards
+            current_lengths += 1
+
+            # then save the metrics of the episodes that just ended
+            for i in np.flatnonzero(dones):
+                episode_rewards[i].append(float(current_rewards[i]))
+                episode_lengths[i].append(int(current_lengths[i]))
+                episode_turns[i].append(infos[i]['turn'])
 
-                if dones[i]:
-                    episode_rewards[i].append(0.0)
-                    episode_lengths[i].append(0)
-                    episode_turns[i].append(infos[i]['turn'])
+                episodes_so_far += 1
 
-                    episodes_so_far += 1
+            current_rewards[dones] = 0.0
+            current_lengths[dones] = 0
 
             # check exiting condition
             if episodes_so_far >= self.episodes:
@@ -754,9 +810,9 @@ class Evaluator:
 
         # join all parallel metrics
         all_rewards = [reward for rewards in episode_rewards
-                       for reward in rewards[:-1]]
+                       for reward in rewards]
         all_lengths = [length for lengths in episode_lengths
-                       for length in lengths[:-1]]
+                       for length in lengths]
         all_turns = [turn for turns in episode_turns for turn in turns]
 
         # todo: fix -- sometimes we miss self.episodes by one
@@ -765,7 +821,8 @@ class Evaluator:
         # assert len(all_turns) == self.episodes
 
         # transform the action histogram in a probability distribution
-        action_histogram = [action_freq / sum(action_histogram)
+        total_actions = sum(action_histogram)
+        action_histogram = [action_freq / total_actions
                             for action_freq in action_histogram]
 
         # cap any unsolicited additional episodes
@@ -773,7 +830,7 @@ class Evaluator:
         all_lengths = all_lengths[:self.episodes]
         all_turns = all_turns[:self.episodes]
 
-        return mean(all_rewards), mean(all_lengths), mean(all_turns), action_histogram
+        return np.mean(all_rewards), np.mean(all_lengths), np.mean(all_turns), action_histogram
 
     def close(self):
         self.env.close()
@@ -41,7 +41,7 @@ def encode_state_draft(state, use_history=False,
         assert past_choices is not None, \
             "If encoding the mana curve, past_choices should not be None."
 
-    encoded_state = np.full((state_size,), 0, dtype=np.float32)
+    encoded_state = np.zeros((state_size,), dtype=np.float32)
 
     # if draft is not over, fill current choices
     if state.is_draft():
@@ -65,7 +65,9 @@ def encode_state_draft(state, use_history=False,
 
     # if using mana curve, fill mana curve slots
     if use_mana_curve:
-        for chosen_card in past_choices:
-            encoded_state[chosen_card.cost] += 1
+        costs = np.fromiter((card.cost for card in past_choices),
+                            dtype=np.intp, count=len(past_choices))
+
+        encoded_state[:13] += np.bincount(costs, minlength=13)
 
     return encoded_state